@@ -67,15 +67,20 @@ Z_DEFLATED = 8
 
 Z_NULL = None
 
-_zlib_name = ctypes.util.find_library("z")
-if _zlib_name is None:
-    raise Exception("Could not find zlib")
-if os.name == "posix":
-    # Allow LD_PRELOAD interposition
-    ctypes.CDLL(_zlib_name, mode=ctypes.RTLD_GLOBAL)
-    _zlib = ctypes.CDLL(None)
-else:
+_zlib_name = os.environ.get("RAW_ZLIB_LIB")
+if _zlib_name:
+    # Explicitly selected implementation, e.g. zlib-ng in compat mode
     _zlib = ctypes.CDLL(_zlib_name)
+else:
+    _zlib_name = ctypes.util.find_library("z")
+    if _zlib_name is None:
+        raise Exception("Could not find zlib")
+    if os.name == "posix":
+        # Allow LD_PRELOAD interposition
+        ctypes.CDLL(_zlib_name, mode=ctypes.RTLD_GLOBAL)
+        _zlib = ctypes.CDLL(None)
+    else:
+        _zlib = ctypes.CDLL(_zlib_name)
 
 _zlib.zlibVersion.restype = ctypes.c_char_p
 _zlib.zlibVersion.argtypes = []
@@ -507,3 +512,15 @@ _zlib.inflateSyncPoint.argtypes = [
 
 def inflateSyncPoint(strm):
     return _zlib.inflateSyncPoint(ctypes.addressof(strm))
+
+
+_zlib.crc32.restype = ctypes.c_ulong
+_zlib.crc32.argtypes = [
+    ctypes.c_ulong,  # crc
+    ctypes.c_void_p,  # buf
+    ctypes.c_uint,  # len
+]
+
+
+def crc32(crc, buf, len):
+    return _zlib.crc32(crc, buf, len)
@@ -0,0 +1,141 @@
+import ctypes
+import mmap
+import os
+import sys
+
+import raw_zlib
+
+READ_BUFFER_SIZE = 128 * 1024
+MIN_OBUF_SIZE = 32 * 1024
+MAX_OBUF_SIZE = 8 * 1024 * 1024
+
+
+def alloc_buffer(size):
+    # Anonymous mappings are page-aligned, unlike malloc()ed ctypes buffers
+    buf = mmap.mmap(-1, size)
+    return buf, ctypes.addressof(ctypes.c_char.from_buffer(buf))
+
+
+class FdWriter(object):
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, b):
+        mv = memoryview(b)
+        while mv:
+            mv = mv[os.write(self.fd, mv) :]
+
+    def flush(self):
+        pass
+
+
+class BufferReader(object):
+    def __init__(self, ifp):
+        self.ifp = ifp
+        self.buf, self.addr = alloc_buffer(READ_BUFFER_SIZE)
+        self.eof = False
+
+    def read(self):
+        # Callers ask for more only once the previous chunk is consumed, so a
+        # single buffer is enough
+        if self.eof:
+            return self.addr, 0
+        n = self.ifp.readinto(self.buf)
+        self.eof = n == 0
+        return self.addr, n
+
+
+class Crc32Reader(object):
+    def __init__(self, reader):
+        self.reader = reader
+        self.crc = 0
+
+    def read(self):
+        addr, n = self.reader.read()
+        self.crc = raw_zlib.crc32(self.crc, addr, n)
+        return addr, n
+
+
+class BufferWriter(object):
+    def __init__(self, ofp, max_size=MAX_OBUF_SIZE):
+        self.ofp = ofp
+        self.size = min(READ_BUFFER_SIZE, max_size)
+        self.max_size = max_size
+        self.slot = self._make_slot(self.size)
+
+    @staticmethod
+    def _make_slot(size):
+        # Compute the address and the size once per buffer, not per inflate()
+        obuf, obuf_addr = alloc_buffer(size)
+        return obuf, memoryview(obuf), obuf_addr, size
+
+    def acquire(self):
+        if self.slot[3] != self.size:
+            self.slot = self._make_slot(self.size)
+        return self.slot[2], self.slot[3]
+
+    def resize(self, size):
+        size = min(max(size, MIN_OBUF_SIZE), self.max_size)
+        # Reallocate only on significant changes, but never stay above max_size
+        if size > self.size * 4 or size * 4 < self.size or self.size > self.max_size:
+            self.size = size
+
+    def release(self, n):
+        self.ofp.write(self.slot[1][:n])
+
+    def close(self):
+        self.ofp.flush()
+
+
+class Crc32Writer(object):
+    def __init__(self, writer):
+        self.writer = writer
+        self.crc = 0
+        self.addr = None
+
+    def acquire(self):
+        self.addr, size = self.writer.acquire()
+        return self.addr, size
+
+    def resize(self, size):
+        self.writer.resize(size)
+
+    def release(self, n):
+        self.crc = raw_zlib.crc32(self.crc, self.addr, n)
+        self.writer.release(n)
+
+
+def add_arguments(parser):
+    parser.add_argument("--window-bits", type=int, default=15)
+    parser.add_argument("--dict", help="file with the preset dictionary")
+    parser.add_argument(
+        "--raw", action="store_true", help="no zlib/gzip header and trailer"
+    )
+    parser.add_argument(
+        "--crc32",
+        action="store_true",
+        help="print CRC-32 of the uncompressed data to stderr",
+    )
+
+
+def get_window_bits(args):
+    if args.raw:
+        return -(abs(args.window_bits) & 15)
+    return args.window_bits
+
+
+def read_dictionary(args):
+    if args.dict is None:
+        return None
+    with open(args.dict, "rb") as fp:
+        return fp.read()
+
+
+def open_stdio():
+    # Bypass Python-level buffering: ibuf/obuf already batch I/O
+    sys.stdout.flush()
+    return sys.stdin.buffer.raw, FdWriter(sys.stdout.fileno())
+
+
+def print_crc32(crc):
+    sys.stderr.write("{:08x}\n".format(crc))
@@ -1,53 +1,176 @@
 #!/usr/bin/env python3
 import argparse
-import ctypes
 import sys
 
 import raw_zlib
+from raw_zlib.test import _streaming
 
+WRITE_BUFFER_SIZE = 1024 * 1024
+WRITE_LOW_WATER = 64 * 1024
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--window-bits", type=int, default=15)
-    args = parser.parse_args()
-    strm = raw_zlib.z_stream(
-        zalloc=raw_zlib.Z_NULL, free=raw_zlib.Z_NULL, opaque=raw_zlib.Z_NULL
-    )
-    if args.window_bits == 15:
-        init_func_name = "deflateInit"
-        rc = raw_zlib.deflateInit(strm, raw_zlib.Z_DEFAULT_COMPRESSION)
-    else:
-        init_func_name = "deflateInit2"
-        rc = raw_zlib.deflateInit2(
-            strm=strm,
-            level=raw_zlib.Z_DEFAULT_COMPRESSION,
-            method=raw_zlib.Z_DEFLATED,
-            windowBits=args.window_bits,
-            memLevel=8,
-            strategy=raw_zlib.Z_DEFAULT_STRATEGY,
+STRATEGIES = {
+    "default": raw_zlib.Z_DEFAULT_STRATEGY,
+    "filtered": raw_zlib.Z_FILTERED,
+    "huffman-only": raw_zlib.Z_HUFFMAN_ONLY,
+    "rle": raw_zlib.Z_RLE,
+    "fixed": raw_zlib.Z_FIXED,
+}
+
+
+class DeflateSession(object):
+    def __init__(
+        self,
+        window_bits=15,
+        level=raw_zlib.Z_DEFAULT_COMPRESSION,
+        mem_level=8,
+        strategy=raw_zlib.Z_DEFAULT_STRATEGY,
+        tune=None,
+        dictionary=None,
+    ):
+        self.window_bits = window_bits
+        self.level = level
+        self.mem_level = mem_level
+        self.strategy = strategy
+        self.tune = tune
+        self.dictionary = dictionary
+        self.strm = raw_zlib.z_stream(
+            zalloc=raw_zlib.Z_NULL, free=raw_zlib.Z_NULL, opaque=raw_zlib.Z_NULL
+        )
+        self.obuf, self.obuf_addr = _streaming.alloc_buffer(WRITE_BUFFER_SIZE)
+        self.obuf_mv = memoryview(self.obuf)
+
+    def __enter__(self):
+        if (
+            self.window_bits == 15
+            and self.mem_level == 8
+            and self.strategy == raw_zlib.Z_DEFAULT_STRATEGY
+        ):
+            init_func_name = "deflateInit"
+            rc = raw_zlib.deflateInit(self.strm, self.level)
+        else:
+            init_func_name = "deflateInit2"
+            rc = raw_zlib.deflateInit2(
+                strm=self.strm,
+                level=self.level,
+                method=raw_zlib.Z_DEFLATED,
+                windowBits=self.window_bits,
+                memLevel=self.mem_level,
+                strategy=self.strategy,
+            )
+        if rc != raw_zlib.Z_OK:
+            raise Exception("{}() failed with error {}".format(init_func_name, rc))
+        if self.tune is not None:
+            rc = raw_zlib.deflateTune(self.strm, *self.tune)
+            if rc != raw_zlib.Z_OK:
+                raw_zlib.deflateEnd(self.strm)
+                raise Exception("deflateTune() failed with error {}".format(rc))
+        try:
+            self._set_dictionary()
+        except Exception:
+            raw_zlib.deflateEnd(self.strm)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        rc = raw_zlib.deflateEnd(self.strm)
+        if rc != raw_zlib.Z_OK and exc_type is None:
+            raise Exception("deflateEnd() failed with error {}".format(rc))
+
+    def _set_dictionary(self):
+        if self.dictionary is None:
+            return
+        rc = raw_zlib.deflateSetDictionary(
+            self.strm, self.dictionary, len(self.dictionary)
         )
-    if rc != raw_zlib.Z_OK:
-        raise Exception("{}() failed with error {}".format(init_func_name, rc))
-    stream_end = False
-    obuf = ctypes.create_string_buffer(8192)
-    while not stream_end:
-        ibuf = sys.stdin.buffer.read(16384)
-        strm.next_in = ibuf
-        strm.avail_in = len(ibuf)
-        flush = raw_zlib.Z_FINISH if strm.avail_in == 0 else raw_zlib.Z_NO_FLUSH
-        while not stream_end:
-            if flush != raw_zlib.Z_FINISH and strm.avail_in == 0:
+        if rc != raw_zlib.Z_OK:
+            raise Exception("deflateSetDictionary() failed with error {}".format(rc))
+
+    def run(self, reader, ofp):
+        strm = self.strm
+        obuf_mv = self.obuf_mv
+        obuf_addr = self.obuf_addr
+        obuf_size = len(self.obuf)
+        Z_OK = raw_zlib.Z_OK
+        Z_STREAM_END = raw_zlib.Z_STREAM_END
+        Z_NO_FLUSH = raw_zlib.Z_NO_FLUSH
+        Z_FINISH = raw_zlib.Z_FINISH
+        # Accumulate the output of several deflate() calls and write it once
+        # less than WRITE_LOW_WATER bytes are left
+        offset = 0
+        # Steady state: flush is always Z_NO_FLUSH
+        while True:
+            strm.next_in, strm.avail_in = reader.read()
+            if strm.avail_in == 0:
                 break
-            strm.next_out = ctypes.addressof(obuf)
-            strm.avail_out = ctypes.sizeof(obuf)
-            rc = raw_zlib.deflate(strm, flush)
-            stream_end = rc == raw_zlib.Z_STREAM_END and flush == raw_zlib.Z_FINISH
-            if rc != raw_zlib.Z_OK and not stream_end:
+            while strm.avail_in != 0:
+                avail_in = strm.avail_in
+                strm.next_out = obuf_addr + offset
+                strm.avail_out = obuf_size - offset
+                rc = raw_zlib.deflate(strm, Z_NO_FLUSH)
+                if rc != Z_OK:
+                    raise Exception("deflate() failed with error {}".format(rc))
+                n = obuf_size - offset - strm.avail_out
+                offset += n
+                if strm.avail_out < WRITE_LOW_WATER:
+                    ofp.write(obuf_mv[:offset])
+                    offset = 0
+                if n == 0 and strm.avail_in == avail_in:
+                    raise Exception("deflate() made no progress, rc={}".format(rc))
+        # End of input: Z_FINISH until Z_STREAM_END
+        while True:
+            strm.next_out = obuf_addr + offset
+            strm.avail_out = obuf_size - offset
+            rc = raw_zlib.deflate(strm, Z_FINISH)
+            if rc != Z_OK and rc != Z_STREAM_END:
                 raise Exception("deflate() failed with error {}".format(rc))
-            sys.stdout.buffer.write(obuf[: len(obuf) - strm.avail_out])
-    rc = raw_zlib.deflateEnd(strm)
-    if rc != raw_zlib.Z_OK:
-        raise Exception("deflateEnd() failed with error {}".format(rc))
+            n = obuf_size - offset - strm.avail_out
+            offset += n
+            if rc == Z_STREAM_END:
+                ofp.write(obuf_mv[:offset])
+                return
+            if strm.avail_out < WRITE_LOW_WATER:
+                ofp.write(obuf_mv[:offset])
+                offset = 0
+            if n == 0:
+                raise Exception("deflate() made no progress, rc={}".format(rc))
+
+
+def run(argv, ifp, ofp):
+    parser = argparse.ArgumentParser()
+    _streaming.add_arguments(parser)
+    parser.add_argument("--level", type=int, default=raw_zlib.Z_DEFAULT_COMPRESSION)
+    parser.add_argument("--mem-level", type=int, default=8)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="default")
+    tune_args = ("good_length", "max_lazy", "nice_length", "max_chain")
+    for tune_arg in tune_args:
+        parser.add_argument("--" + tune_arg.replace("_", "-"), type=int)
+    args = parser.parse_args(argv)
+    tune = tuple(getattr(args, tune_arg) for tune_arg in tune_args)
+    if all(x is None for x in tune):
+        tune = None
+    elif any(x is None for x in tune):
+        parser.error(
+            "--good-length, --max-lazy, --nice-length and --max-chain "
+            "must be specified together"
+        )
+    reader = _streaming.BufferReader(ifp)
+    if args.crc32:
+        reader = _streaming.Crc32Reader(reader)
+    with DeflateSession(
+        window_bits=_streaming.get_window_bits(args),
+        level=args.level,
+        mem_level=args.mem_level,
+        strategy=STRATEGIES[args.strategy],
+        tune=tune,
+        dictionary=_streaming.read_dictionary(args),
+    ) as session:
+        session.run(reader, ofp)
+    if args.crc32:
+        _streaming.print_crc32(reader.crc)
+
+
+def main():
+    run(sys.argv[1:], *_streaming.open_stdio())
 
 
 if __name__ == "__main__":
@@ -1,50 +1,155 @@
 #!/usr/bin/env python3
 import argparse
-import ctypes
 import sys
 
 import raw_zlib
+from raw_zlib.test import _streaming
 
+RESIZE_INTERVAL = 8
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--window-bits", type=int, default=15)
-    args = parser.parse_args()
-    strm = raw_zlib.z_stream(
-        next_in=raw_zlib.Z_NULL,
-        avail_in=0,
-        zalloc=raw_zlib.Z_NULL,
-        free=raw_zlib.Z_NULL,
-        opaque=raw_zlib.Z_NULL,
-    )
-    if args.window_bits == 15:
-        init_func_name = "inflateInit"
-        rc = raw_zlib.inflateInit(strm)
-    else:
-        init_func_name = "inflateInit2"
-        rc = raw_zlib.inflateInit2(strm, args.window_bits)
-    if rc != raw_zlib.Z_OK:
-        raise Exception("{}() failed with error {}".format(init_func_name, rc))
-    stream_end = False
-    obuf = ctypes.create_string_buffer(16384)
-    while not stream_end:
-        ibuf = sys.stdin.buffer.read(8192)
-        strm.next_in = ibuf
-        strm.avail_in = len(ibuf)
+
+class InflateSession(object):
+    def __init__(self, window_bits=15, dictionary=None):
+        self.window_bits = window_bits
+        self.dictionary = dictionary
+        self.strm = raw_zlib.z_stream(
+            next_in=raw_zlib.Z_NULL,
+            avail_in=0,
+            zalloc=raw_zlib.Z_NULL,
+            free=raw_zlib.Z_NULL,
+            opaque=raw_zlib.Z_NULL,
+        )
+
+    def __enter__(self):
+        if self.window_bits == 15:
+            init_func_name = "inflateInit"
+            rc = raw_zlib.inflateInit(self.strm)
+        else:
+            init_func_name = "inflateInit2"
+            rc = raw_zlib.inflateInit2(self.strm, self.window_bits)
+        if rc != raw_zlib.Z_OK:
+            raise Exception("{}() failed with error {}".format(init_func_name, rc))
+        if self.window_bits < 0 and self.dictionary is not None:
+            # Raw streams have no header to request the dictionary
+            try:
+                self.set_dictionary()
+            except Exception:
+                raw_zlib.inflateEnd(self.strm)
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        rc = raw_zlib.inflateEnd(self.strm)
+        if rc != raw_zlib.Z_OK and exc_type is None:
+            raise Exception("inflateEnd() failed with error {}".format(rc))
+
+    def reset(self):
+        rc = raw_zlib.inflateReset(self.strm)
+        if rc != raw_zlib.Z_OK:
+            raise Exception("inflateReset() failed with error {}".format(rc))
+        if self.window_bits < 0 and self.dictionary is not None:
+            self.set_dictionary()
+
+    def set_dictionary(self):
+        if self.dictionary is None:
+            raise Exception("inflate() needs a dictionary")
+        # For zlib streams, zlib checks the dictionary against the Adler-32
+        # from the header and fails with Z_DATA_ERROR on mismatch
+        rc = raw_zlib.inflateSetDictionary(
+            self.strm, self.dictionary, len(self.dictionary)
+        )
+        if rc != raw_zlib.Z_OK:
+            raise Exception("inflateSetDictionary() failed with error {}".format(rc))
+
+    def fill(self, reader):
+        strm = self.strm
+        if strm.avail_in == 0:
+            strm.next_in, strm.avail_in = reader.read()
+        return strm.avail_in
+
+    def run(self, reader, writer):
+        strm = self.strm
+        Z_OK = raw_zlib.Z_OK
+        Z_STREAM_END = raw_zlib.Z_STREAM_END
+        Z_BUF_ERROR = raw_zlib.Z_BUF_ERROR
+        Z_NO_FLUSH = raw_zlib.Z_NO_FLUSH
+        Z_NEED_DICT = raw_zlib.Z_NEED_DICT
+        # Size output buffers after the observed compression ratio, so that
+        # highly compressible streams do not need many inflate() calls
+        total_in = 0
+        total_out = 0
+        iterations = 0
+        stream_end = False
         while not stream_end:
-            strm.next_out = ctypes.addressof(obuf)
-            strm.avail_out = ctypes.sizeof(obuf)
-            rc = raw_zlib.inflate(strm, raw_zlib.Z_NO_FLUSH)
-            if rc == raw_zlib.Z_STREAM_END:
+            iterations += 1
+            if iterations % RESIZE_INTERVAL == 0:
+                ratio = total_out / max(1, total_in)
+                writer.resize(int(ratio * _streaming.READ_BUFFER_SIZE))
+            avail_in = self.fill(reader)
+            strm.next_out, obuf_size = writer.acquire()
+            strm.avail_out = obuf_size
+            rc = raw_zlib.inflate(strm, Z_NO_FLUSH)
+            if rc == Z_STREAM_END:
                 stream_end = True
-            elif rc == raw_zlib.Z_BUF_ERROR:
-                break
-            elif rc != raw_zlib.Z_OK:
+            elif rc == Z_NEED_DICT:
+                self.set_dictionary()
+            elif rc != Z_OK and rc != Z_BUF_ERROR:
                 raise Exception("inflate() failed with error {}".format(rc))
-            sys.stdout.buffer.write(obuf[: len(obuf) - strm.avail_out])
-    rc = raw_zlib.inflateEnd(strm)
-    if rc != raw_zlib.Z_OK:
-        raise Exception("inflateEnd() failed with error {}".format(rc))
+            n = obuf_size - strm.avail_out
+            writer.release(n)
+            total_in += avail_in - strm.avail_in
+            total_out += n
+            if not stream_end and n == 0 and strm.avail_in == avail_in:
+                # Neither input consumed nor output produced: the input is
+                # truncated, and looping would spin forever
+                raise Exception("inflate() made no progress, rc={}".format(rc))
+
+
+def obuf_size(s):
+    size = int(s)
+    if size < _streaming.MIN_OBUF_SIZE:
+        raise argparse.ArgumentTypeError(
+            "must be at least {}".format(_streaming.MIN_OBUF_SIZE)
+        )
+    return size
+
+
+def run(argv, ifp, ofp):
+    parser = argparse.ArgumentParser()
+    _streaming.add_arguments(parser)
+    parser.add_argument(
+        "--multi-stream",
+        action="store_true",
+        help="inflate concatenated streams until the end of input",
+    )
+    parser.add_argument(
+        "--max-obuf",
+        type=obuf_size,
+        default=_streaming.MAX_OBUF_SIZE,
+        help="upper bound for the output buffer size",
+    )
+    args = parser.parse_args(argv)
+    reader = _streaming.BufferReader(ifp)
+    buffer_writer = _streaming.BufferWriter(ofp, max_size=args.max_obuf)
+    if args.crc32:
+        writer = _streaming.Crc32Writer(buffer_writer)
+    else:
+        writer = buffer_writer
+    with InflateSession(
+        window_bits=_streaming.get_window_bits(args),
+        dictionary=_streaming.read_dictionary(args),
+    ) as session:
+        session.run(reader, writer)
+        while args.multi_stream and session.fill(reader) != 0:
+            session.reset()
+            session.run(reader, writer)
+    buffer_writer.close()
+    if args.crc32:
+        _streaming.print_crc32(writer.crc)
+
+
+def main():
+    run(sys.argv[1:], *_streaming.open_stdio())
 
 
 if __name__ == "__main__":